@@ -1,16 +1,21 @@
 import os
 import sqlite3
-import json
+import orjson
 import re
 import time
+import heapq
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask.json.provider import JSONProvider
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, build_http
 import google.generativeai as genai
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
 from dotenv import load_dotenv
+from cachetools import TTLCache
 import logging
 import sys
-from threading import Lock
+from threading import Lock, local
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # PostgreSQL 연결
 try:
@@ -42,33 +47,154 @@ load_dotenv()
 # --- 설정 ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-MAX_WORKERS = int(os.getenv("MAX_WORKERS", "1"))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
+MAX_JOBS = int(os.getenv("MAX_JOBS", "2"))
+YOUTUBE_API_RPS = float(os.getenv("YOUTUBE_API_RPS", "5"))
+TRANSCRIPT_RPS = float(os.getenv("TRANSCRIPT_RPS", "0.5"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
 DATABASE_PATH = os.getenv("DATABASE_PATH", "recipes.db")
 DATABASE_URL = os.getenv("DATABASE_URL")
 FREE_TIER_LIMIT = 10
+RECOMMEND_LIMIT = 20
+RECOMMEND_CANDIDATES = 50
+
+# 자주 쓰는 정규식 미리 컴파일
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_COMMA_RE = re.compile(r',+')
+_PLAYLIST_RE = re.compile(r'list=([a-zA-Z0-9_-]+)')
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|。\s*')
 
 if not GEMINI_API_KEY or not YOUTUBE_API_KEY:
     logger.error("API 키가 설정되지 않았습니다.")
     raise ValueError("API keys not configured")
 
 genai.configure(api_key=GEMINI_API_KEY)
-youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+# JSON 응답을 직접 받도록 설정한 모델을 전역으로 재사용
+GEMINI_MODEL = genai.GenerativeModel(
+    'gemini-2.5-flash',
+    generation_config={"response_mime_type": "application/json"}
+)
+
+# --- YouTube 클라이언트 ---
+# httplib2.Http는 스레드 안전하지 않으므로 워커 스레드마다 하나씩 두고 연결을 재사용 (keep-alive)
+_http_local = local()
+
+def get_thread_http():
+    if not hasattr(_http_local, 'http'):
+        _http_local.http = build_http()
+    return _http_local.http
+
+class ThreadLocalHttpRequest(HttpRequest):
+    """build()가 넘겨주는 공용 http 대신 현재 스레드의 httplib2.Http로 요청"""
+    def __init__(self, http, *args, **kwargs):
+        super().__init__(get_thread_http(), *args, **kwargs)
+
+# 내장(static) discovery 문서를 사용하므로 시작 시 HTTP 요청 없음
+youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY,
+                requestBuilder=ThreadLocalHttpRequest, cache_discovery=False)
+
+class OrjsonProvider(JSONProvider):
+    """orjson 기반 JSON 직렬화 (jsonify, 세션 쿠키 등)"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
 
-processing_status = {}
+# 공용 스레드 풀: 영상 처리용(EXECUTOR)과 플레이리스트 작업 조율용(JOB_EXECUTOR)
+# 작업 조율 스레드가 영상 처리 결과를 기다리므로 같은 풀을 쓰면 교착될 수 있어 분리
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="video")
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="job")
+# 영상 하나 안에서 서로 독립적인 수집(댓글, 영상 정보)을 동시에 실행하는 풀
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS * 2, thread_name_prefix="fetch")
+
+# 세션별 진행 상황 (1시간 후 자동 만료)
+processing_status = TTLCache(maxsize=4096, ttl=3600)
 status_lock = Lock()
 
+# --- 외부 서비스별 요청 속도 제한 ---
+class TokenBucket:
+    """초당 rate개씩 토큰이 채워지는 버킷 (워커 스레드 공용)"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+    
+    def acquire(self):
+        """토큰 하나를 얻을 때까지 대기"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+youtube_bucket = TokenBucket(rate=YOUTUBE_API_RPS, capacity=max(1, YOUTUBE_API_RPS))
+transcript_bucket = TokenBucket(rate=TRANSCRIPT_RPS, capacity=max(1, MAX_WORKERS))
+gemini_bucket = TokenBucket(rate=GEMINI_RPM / 60, capacity=max(1, GEMINI_RPM))
+
+# --- 데이터 소스 (비트마스크) ---
+SOURCE_TRANSCRIPT = 1
+SOURCE_DESCRIPTION = 2
+SOURCE_COMMENTS = 4
+SOURCE_LABELS = ((SOURCE_TRANSCRIPT, '자막'), (SOURCE_DESCRIPTION, '설명'), (SOURCE_COMMENTS, '댓글'))
+
+def data_sources_mask(data_dict):
+    return ((SOURCE_TRANSCRIPT if data_dict.get('transcript') else 0)
+            | (SOURCE_DESCRIPTION if data_dict.get('description') else 0)
+            | (SOURCE_COMMENTS if data_dict.get('comments') else 0))
+
+def format_data_sources(value):
+    """비트마스크를 표시용 문자열로 변환 (이전 형식의 문자열 값은 그대로 반환)"""
+    if isinstance(value, str):
+        if not value.isdigit():
+            return value
+        value = int(value)
+    labels = [label for bit, label in SOURCE_LABELS if (value or 0) & bit]
+    return ','.join(labels) if labels else '없음'
+
 # --- 데이터베이스 ---
+# 스레드별로 연결을 하나씩 열어두고 재사용
+# (요청 스레드는 요청이 끝나면 닫고, 워커 스레드는 계속 재사용)
+# 연결을 쓰는 함수는 `with conn:`으로 감싸 매번 트랜잭션을 커밋/롤백으로 끝냄
+_db_local = local()
+
 def get_db_connection():
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        return conn
+    
     if DATABASE_URL and 'postgres' in DATABASE_URL:
         conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn
     else:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
         conn.row_factory = sqlite3.Row
-        return conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+    
+    _db_local.conn = conn
+    return conn
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    """현재 스레드의 DB 연결 닫기"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
 
 def init_database():
     try:
@@ -85,7 +211,7 @@ def init_database():
                     ingredients TEXT,
                     dish_name TEXT,
                     url TEXT NOT NULL,
-                    data_sources TEXT,
+                    data_sources INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -99,7 +225,7 @@ def init_database():
                     ingredients TEXT,
                     dish_name TEXT,
                     url TEXT NOT NULL,
-                    data_sources TEXT,
+                    data_sources INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -107,21 +233,84 @@ def init_database():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingredients ON recipes(ingredients)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_id ON recipes(video_id)")
         
+        # 이전 형식("자막,설명,댓글") data_sources 값을 비트마스크로 변환
+        if not (DATABASE_URL and 'postgres' in DATABASE_URL):
+            cursor.execute("""
+                UPDATE recipes SET data_sources =
+                    (instr(data_sources, '자막') > 0) * 1
+                    + (instr(data_sources, '설명') > 0) * 2
+                    + (instr(data_sources, '댓글') > 0) * 4
+                WHERE typeof(data_sources) = 'text' AND data_sources NOT GLOB '[0-9]*'
+            """)
+        
+        # 이전 버전에서 만든 재료 검색용 FTS5 인덱스 제거
+        # 한국어 재료명은 대부분 2글자(마늘, 김치)라 trigram 인덱스를 쓰지 못하고 항상 전체 스캔이 되므로
+        # 쓰기마다 트리거 비용만 들었음
+        if not (DATABASE_URL and 'postgres' in DATABASE_URL):
+            cursor.execute("DROP TRIGGER IF EXISTS recipes_fts_ai")
+            cursor.execute("DROP TRIGGER IF EXISTS recipes_fts_ad")
+            cursor.execute("DROP TRIGGER IF EXISTS recipes_fts_au")
+            cursor.execute("DROP TABLE IF EXISTS recipes_fts")
+        
+        # 자막 캐시 (재시작 후에도 유지)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS transcript_cache (
+                video_id TEXT PRIMARY KEY,
+                transcript TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         conn.commit()
-        conn.close()
         logger.info("데이터베이스 초기화 완료")
     except Exception as e:
         logger.error(f"데이터베이스 초기화 실패: {e}")
+    finally:
+        close_db()
 
 init_database()
 
-def check_if_video_exists(video_id):
+def get_existing_video_ids(video_ids):
+    """이미 처리된 영상 ID 집합 (쿼리 1회)"""
+    if not video_ids:
+        return set()
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM recipes WHERE video_id = ?", (video_id,))
-    exists = cursor.fetchone()[0] > 0
-    conn.close()
-    return exists
+    with conn:
+        cursor = conn.cursor()
+        placeholders = ','.join('?' * len(video_ids))
+        cursor.execute(f"SELECT video_id FROM recipes WHERE video_id IN ({placeholders})", list(video_ids))
+        return set(row[0] for row in cursor.fetchall())
+
+def save_recipes(rows):
+    """레시피 행들을 하나의 트랜잭션으로 일괄 저장"""
+    if not rows:
+        return
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT OR IGNORE INTO recipes (video_id, title, description, ingredients, dish_name, url, data_sources)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    logger.info(f"레시피 {len(rows)}개 저장 완료")
+
+def get_cached_transcript(video_id):
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT transcript FROM transcript_cache WHERE video_id = ?", (video_id,))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_cached_transcript(video_id, transcript):
+    try:
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR REPLACE INTO transcript_cache (video_id, transcript) VALUES (?, ?)",
+                           (video_id, transcript))
+    except Exception as e:
+        logger.warning(f"자막 캐시 저장 실패: {e}")
 
 # --- YouTube 데이터 수집 ---
 def get_playlist_items(playlist_id):
@@ -136,6 +325,7 @@ def get_playlist_items(playlist_id):
                 maxResults=50,
                 pageToken=next_page_token
             )
+            youtube_bucket.acquire()
             response = request.execute()
             
             for item in response["items"]:
@@ -155,6 +345,7 @@ def get_playlist_items(playlist_id):
 def get_video_info(video_id):
     try:
         request = youtube.videos().list(part="snippet", id=video_id)
+        youtube_bucket.acquire()
         response = request.execute()
         
         if not response["items"]:
@@ -170,13 +361,48 @@ def get_video_info(video_id):
         logger.error(f"비디오 정보 가져오기 실패: {e}")
         return None
 
+def get_videos_info_bulk(video_ids):
+    """여러 영상 정보를 한 번에 가져오기 (요청당 최대 50개)"""
+    videos = {}
+    try:
+        for start in range(0, len(video_ids), 50):
+            chunk = video_ids[start:start + 50]
+            request = youtube.videos().list(
+                part="snippet",
+                id=",".join(chunk),
+                fields="items(id,snippet(title,description))"
+            )
+            youtube_bucket.acquire()
+            response = request.execute()
+            
+            for video in response.get("items", []):
+                videos[video["id"]] = {
+                    'title': video["snippet"]["title"],
+                    'description': video["snippet"]["description"],
+                    'url': f"https://www.youtube.com/watch?v={video['id']}"
+                }
+        
+        logger.info(f"비디오 정보 {len(videos)}개 일괄 조회")
+    except Exception as e:
+        logger.error(f"비디오 정보 일괄 조회 실패: {e}")
+    return videos
+
 def get_video_transcript(video_id):
     """자막 가져오기 - 최종 수정 버전"""
     
     LANGUAGES_TO_CHECK = ['ko', 'en']
     
+    try:
+        cached = get_cached_transcript(video_id)
+        if cached:
+            logger.info(f"자막 캐시 사용 ({len(cached)}자)")
+            return cached
+    except Exception as e:
+        logger.warning(f"자막 캐시 조회 실패: {e}")
+    
     try:
         # 1. YouTubeTranscriptApi 인스턴스 생성
+        transcript_bucket.acquire()
         ytt_api = YouTubeTranscriptApi() 
         
         # 2. 사용 가능한 자막 트랙 목록 가져오기
@@ -199,27 +425,19 @@ def get_video_transcript(video_id):
         
         # 5. 자막 내용 추출
         transcript_data = transcript.fetch()
-        print(f"✅ 자막 데이터 타입: {type(transcript_data)}")
-        if transcript_data:
-            print(f"✅ 첫 번째 항목 타입: {type(transcript_data[0])}")
-            print(f"✅ 첫 번째 항목 내용: {transcript_data[0]}")
-            print(f"✅ 첫 번째 항목 속성: {dir(transcript_data[0])}")
-                
-        # 🔥 핵심 수정: 속성 접근 방식으로 변경
-        # FetchedTranscriptSnippet 객체는 .text 속성을 가지고 있음
-        text_parts = []
-        for snippet in transcript_data:
-            # 속성 접근 방식 사용
-            if hasattr(snippet, 'text'):
-                text_parts.append(snippet.text)
-            # 혹시 딕셔너리인 경우도 대비
-            elif isinstance(snippet, dict):
-                text_parts.append(snippet.get('text', ''))
-        
-        text = ' '.join(text_parts)
+        if transcript_data and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"자막 데이터 타입: {type(transcript_data)}, 첫 번째 항목: {transcript_data[0]!r}")
+        
+        # FetchedTranscriptSnippet 객체는 .text 속성을 가지고 있음 (딕셔너리인 경우도 대비)
+        text = ' '.join(
+            snippet.text if hasattr(snippet, 'text') else snippet.get('text', '')
+            for snippet in transcript_data
+            if hasattr(snippet, 'text') or isinstance(snippet, dict)
+        )
         
         if text:
             logger.info(f"자막 추출 성공 ({len(text)}자)")
+            save_cached_transcript(video_id, text)
             return text
         else:
             logger.warning(f"자막 데이터가 비어있음: {video_id}")
@@ -236,9 +454,8 @@ def get_video_transcript(video_id):
         return None
     except Exception as e:
         logger.error(f"자막 가져오기 실패 (최종 오류): {type(e).__name__} - {e}")
-        # 상세 디버깅 정보
-        import traceback
-        logger.debug(f"상세 에러:\n{traceback.format_exc()}")
+        # 상세 디버깅 정보 (DEBUG 레벨일 때만 스택 트레이스 포맷)
+        logger.debug("상세 에러", exc_info=True)
         return None
 
 def get_video_comments(video_id, max_comments=8):
@@ -250,13 +467,14 @@ def get_video_comments(video_id, max_comments=8):
             maxResults=max_comments,
             order="relevance"  # 관련성 높은 순
         )
+        youtube_bucket.acquire()
         response = request.execute()
         
         comments = []
         for item in response.get("items", []):
             comment = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
             # HTML 태그 제거
-            comment = re.sub(r'<[^>]+>', '', comment)
+            comment = _HTML_TAG_RE.sub('', comment)
             comments.append(comment)
         
         comments_text = ' | '.join(comments)
@@ -267,22 +485,81 @@ def get_video_comments(video_id, max_comments=8):
         return None
 
 # --- Gemini 분석 ---
+MAX_SENTENCE_CHARS = 200
+
+def _split_sentences(text):
+    """문장 단위로 나누기 (구두점 없는 자동 자막은 MAX_SENTENCE_CHARS 단위로 자름)"""
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > MAX_SENTENCE_CHARS:
+            cut = sentence.rfind(' ', 0, MAX_SENTENCE_CHARS)
+            if cut <= 0:
+                cut = MAX_SENTENCE_CHARS
+            yield sentence[:cut]
+            sentence = sentence[cut:].strip()
+        if sentence:
+            yield sentence
+
+def _dedupe(parts):
+    seen = set()
+    unique = []
+    for part in parts:
+        key = _WS_RE.sub(' ', part).strip()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(part)
+    return unique
+
+def _compact_transcript(text, budget=2000):
+    """중복 문장을 제거하고 영상 전체에서 고르게 문장을 골라 budget자 이내로 압축"""
+    sentences = _dedupe(_split_sentences(text))
+    total = sum(len(sentence) + 1 for sentence in sentences)
+    if total <= budget:
+        return ' '.join(sentences)
+    
+    # 일정 간격으로 한 바퀴씩 돌며 선택 (0, step, 2*step, ... → 1, step+1, ...)
+    step = -(-total // budget)
+    selected = set()
+    used = 0
+    for offset in range(step):
+        for idx in range(offset, len(sentences), step):
+            length = len(sentences[idx]) + 1
+            if used + length > budget:
+                continue
+            selected.add(idx)
+            used += length
+    return ' '.join(sentences[idx] for idx in sorted(selected))
+
+def _compact_comments(text, budget=800):
+    """중복 댓글을 제거하고 budget자 이내로 자르기"""
+    comments = []
+    used = 0
+    for comment in _dedupe(text.split(' | ')):
+        remaining = budget - used
+        if len(comment) + 3 > remaining:
+            if comments:
+                # 들어가지 않는 댓글은 건너뛰고 뒤의 짧은 댓글로 채움
+                continue
+            # 첫 댓글이 너무 길면 잘라서라도 포함
+            comment = comment[:remaining]
+        comments.append(comment)
+        used += len(comment) + 3
+    return ' | '.join(comments)
+
 def analyze_with_gemini(data_dict, title):
     """모든 수집 데이터를 Gemini로 종합 분석"""
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         # 데이터 조합
         available_data = []
         if data_dict.get('transcript'):
-            available_data.append(f"자막: {data_dict['transcript'][:2000]}")
+            available_data.append(f"자막: {_compact_transcript(data_dict['transcript'])}")
         if data_dict.get('description'):
             available_data.append(f"설명: {data_dict['description'][:1000]}")
         if data_dict.get('comments'):
-            available_data.append(f"댓글: {data_dict['comments'][:800]}")
+            available_data.append(f"댓글: {_compact_comments(data_dict['comments'])}")
         
         if not available_data:
-            return title, "", []
+            return title, "", 0
         
         combined_text = "\n\n".join(available_data)
         
@@ -302,15 +579,12 @@ def analyze_with_gemini(data_dict, title):
 {{"dish_name": "요리이름", "ingredients": "재료1,재료2,재료3"}}
 """
         
-        response = model.generate_content(prompt)
+        gemini_bucket.acquire()
+        response = GEMINI_MODEL.generate_content(prompt)
         result = response.text.strip()
         
-        # JSON 추출
-        result = re.sub(r'^```json?\s*', '', result)
-        result = re.sub(r'\s*```$', '', result)
-        
         # 🚨 핵심 수정 부분 시작
-        data = json.loads(result)
+        data = orjson.loads(result)
         
         # 💡 수정 1: 응답이 리스트인 경우 첫 번째 항목을 데이터로 사용
         # 'list' object has no attribute 'get' 오류 해결
@@ -320,7 +594,7 @@ def analyze_with_gemini(data_dict, title):
             else:
                 # 빈 리스트일 경우
                 logger.error("Gemini가 빈 리스트를 반환했습니다.")
-                return title, "", []
+                return title, "", 0
 
         # 이제 data는 딕셔너리이므로 .get()을 안전하게 사용할 수 있습니다.
         dish_name = data.get('dish_name', title)
@@ -331,54 +605,64 @@ def analyze_with_gemini(data_dict, title):
             ingredients = ','.join(ingredients)
         
         # 정리
-        ingredients = re.sub(r'\s+', '', ingredients)
-        ingredients = re.sub(r',+', ',', ingredients)
+        ingredients = _WS_RE.sub('', ingredients)
+        ingredients = _COMMA_RE.sub(',', ingredients)
         ingredients = ingredients.strip(',')
         
         # 사용된 데이터 소스 기록
-        sources = []
-        if data_dict.get('transcript'):
-            sources.append('자막')
-        if data_dict.get('description'):
-            sources.append('설명')
-        if data_dict.get('comments'):
-            sources.append('댓글')
+        sources = data_sources_mask(data_dict)
         
-        logger.info(f"Gemini 분석 완료: {dish_name}, 소스: {sources}")
+        logger.info(f"Gemini 분석 완료: {dish_name}, 소스: {format_data_sources(sources)}")
         return dish_name, ingredients, sources
         
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"JSON 파싱 실패: {e}")
-        return title, "", []
+        return title, "", 0
     except Exception as e:
         logger.error(f"Gemini 분석 실패: {e}")
-        return title, "", []
+        return title, "", 0
 
 # --- 진행 상황 ---
-def update_status(session_id, current, total, status_text, video_title=""):
+def update_status(session_id, total, status_text, video_title="", completed_videos=0):
+    """진행 상황 갱신 - current는 완료된 영상 수이며 completed_videos만큼 증가"""
     with status_lock:
-        processing_status[session_id] = {
+        status = processing_status.get(session_id, {})
+        current = status.get('current', 0) + completed_videos
+        status.update({
             'current': current,
             'total': total,
             'percentage': int((current / total) * 100) if total > 0 else 0,
             'status': status_text,
             'video_title': video_title,
             'timestamp': time.time()
-        }
+        })
+        processing_status[session_id] = status
+
+def is_job_running(status):
+    return bool(status.get('started')) and not status.get('completed')
+
+def reset_status(session_id, total, status_text):
+    """진행 상황 초기화 (이미 처리 중인 작업이 있으면 그대로 둠)"""
+    with status_lock:
+        if is_job_running(processing_status.get(session_id, {})):
+            return
+        processing_status[session_id] = {}
+    update_status(session_id, total, status_text)
 
 # --- 메인 처리 ---
-def process_single_video(video_id, session_id, current_index, total_videos):
+def process_single_video(video_id, session_id, total_videos, video_info=None):
     """단일 비디오 처리 (YouTube API만 사용)"""
     
-    if check_if_video_exists(video_id):
-        logger.info(f"[{video_id}] 이미 처리됨")
-        update_status(session_id, current_index, total_videos, "이미 처리된 영상")
-        return {"status": "skipped", "video_id": video_id}
-    
     try:
-        # 1. 비디오 정보
-        update_status(session_id, current_index, total_videos, "영상 정보 가져오는 중...")
-        video_info = get_video_info(video_id)
+        # 1. 데이터 수집 - 영상 정보(일괄 조회에 없을 때), 댓글은 백그라운드에서, 자막은 현재 스레드에서 동시에
+        update_status(session_id, total_videos, "자막/댓글 수집 중...",
+                      video_info['title'] if video_info else "")
+        info_future = FETCH_EXECUTOR.submit(get_video_info, video_id) if video_info is None else None
+        comments_future = FETCH_EXECUTOR.submit(get_video_comments, video_id)
+        transcript = get_video_transcript(video_id)
+        comments = comments_future.result()
+        if info_future is not None:
+            video_info = info_future.result()
         if not video_info:
             return {"status": "error", "video_id": video_id}
         
@@ -388,12 +672,10 @@ def process_single_video(video_id, session_id, current_index, total_videos):
         
         logger.info(f"처리 시작: {title}")
         
-        # 2. 데이터 수집
+        # 2. 데이터 조합
         data_dict = {}
         
         # 2-1. 자막
-        update_status(session_id, current_index, total_videos, "자막 확인 중...", title)
-        transcript = get_video_transcript(video_id)
         if transcript:
             data_dict['transcript'] = transcript
         
@@ -402,45 +684,32 @@ def process_single_video(video_id, session_id, current_index, total_videos):
             data_dict['description'] = description
         
         # 2-3. 댓글
-        update_status(session_id, current_index, total_videos, "댓글 수집 중...", title)
-        comments = get_video_comments(video_id)
         if comments:
             data_dict['comments'] = comments
         
         # 3. Gemini 분석
-        update_status(session_id, current_index, total_videos, "AI 분석 중...", title)
+        update_status(session_id, total_videos, "AI 분석 중...", title)
         dish_name, ingredients, sources = analyze_with_gemini(data_dict, title)
         
-        # 4. DB 저장
+        # 4. 저장할 행 구성 (DB 저장은 process_videos에서 일괄 처리)
         if not ingredients:
             logger.warning(f"재료 추출 실패: {title}")
             ingredients = ""
         
-        sources_str = ','.join(sources) if sources else "없음"
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO recipes (video_id, title, description, ingredients, dish_name, url, data_sources)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (video_id, title, description, ingredients, dish_name, video_url, sources_str))
-        conn.commit()
-        conn.close()
-        
-        update_status(session_id, current_index, total_videos, "완료!", title)
-        logger.info(f"저장 완료: {title} | 소스: {sources_str} | 재료: {ingredients[:50] if ingredients else '없음'}")
+        logger.info(f"분석 완료: {title} | 소스: {format_data_sources(sources)} | 재료: {ingredients[:50] if ingredients else '없음'}")
         
         return {
             "status": "success",
             "video_id": video_id,
             "title": title,
             "dish_name": dish_name,
-            "sources": sources
+            "sources": sources,
+            "row": (video_id, title, description, ingredients, dish_name, video_url, sources)
         }
         
     except Exception as e:
         logger.error(f"비디오 처리 실패 ({video_id}): {e}")
-        update_status(session_id, current_index, total_videos, f"오류: {str(e)[:30]}")
+        update_status(session_id, total_videos, f"오류: {str(e)[:30]}")
         return {"status": "error", "video_id": video_id, "message": str(e)}
 
 # --- Flask 라우트 ---
@@ -451,133 +720,10 @@ def index():
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM recipes")
         count = cursor.fetchone()[0]
-        conn.close()
     except:
         count = 0
     
-    return f'''
-        <!DOCTYPE html>
-        <html lang="ko">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>레시피 추출 시스템 v4</title>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', sans-serif;
-                    max-width: 800px;
-                    margin: 50px auto;
-                    padding: 20px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                }}
-                .container {{
-                    background: white;
-                    padding: 40px;
-                    border-radius: 20px;
-                    box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-                }}
-                h1 {{
-                    color: #333;
-                    text-align: center;
-                    margin-bottom: 10px;
-                }}
-                .subtitle {{
-                    text-align: center;
-                    color: #666;
-                    margin-bottom: 30px;
-                    font-size: 14px;
-                }}
-                .badge {{
-                    background: linear-gradient(135deg, #667eea, #764ba2);
-                    color: white;
-                    padding: 4px 12px;
-                    border-radius: 12px;
-                    font-size: 12px;
-                    font-weight: bold;
-                }}
-                .features {{
-                    background: #f8f9fa;
-                    padding: 20px;
-                    border-radius: 10px;
-                    margin: 20px 0;
-                }}
-                .feature-item {{
-                    margin: 10px 0;
-                }}
-                .stats {{
-                    background: #e3f2fd;
-                    padding: 20px;
-                    border-radius: 10px;
-                    margin: 20px 0;
-                    text-align: center;
-                }}
-                .stats-number {{
-                    font-size: 36px;
-                    font-weight: bold;
-                    color: #667eea;
-                }}
-                input[type="text"] {{
-                    width: 100%;
-                    padding: 15px;
-                    margin: 10px 0;
-                    border: 2px solid #ddd;
-                    border-radius: 10px;
-                    box-sizing: border-box;
-                    font-size: 16px;
-                }}
-                button {{
-                    width: 100%;
-                    padding: 15px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    border: none;
-                    border-radius: 10px;
-                    cursor: pointer;
-                    font-size: 18px;
-                    font-weight: bold;
-                }}
-                .link {{
-                    display: block;
-                    text-align: center;
-                    margin-top: 20px;
-                    color: #667eea;
-                    text-decoration: none;
-                    font-weight: bold;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🍳 레시피 추출 시스템</h1>
-                <p class="subtitle">
-                    <span class="badge">v4</span> 안전하고 합법적인 방식 - YouTube API 공식 사용
-                </p>
-                
-                <div class="features">
-                    <strong>📊 데이터 소스 (3가지):</strong>
-                    <div class="feature-item">✅ 자막 (한국어/영어)</div>
-                    <div class="feature-item">✅ 영상 설명</div>
-                    <div class="feature-item">✅ 댓글 (상위 8개)</div>
-                </div>
-                
-                <div class="stats">
-                    <div class="stats-number">{count}</div>
-                    <div>개의 레시피 저장됨</div>
-                </div>
-                
-                <form method="post" action="/process">
-                    <label for="playlist_url"><strong>플레이리스트 URL:</strong></label>
-                    <input type="text" id="playlist_url" name="playlist_url" 
-                           placeholder="https://www.youtube.com/playlist?list=..." required>
-                    <button type="submit">🚀 분석 시작 (최대 10개)</button>
-                </form>
-                
-                <a href="/recommend" class="link">📋 레시피 추천받기 →</a>
-            </div>
-        </body>
-        </html>
-    '''
+    return render_template('index.html', count=count)
 
 @app.route('/process', methods=['POST'])
 def process_playlist():
@@ -586,7 +732,7 @@ def process_playlist():
     if not playlist_url:
         return "플레이리스트 URL을 입력하세요.", 400
     
-    match = re.search(r'list=([a-zA-Z0-9_-]+)', playlist_url)
+    match = _PLAYLIST_RE.search(playlist_url)
     if not match:
         return "유효하지 않은 플레이리스트 URL입니다.", 400
     
@@ -613,6 +759,12 @@ def process_playlist_manual(playlist_id):
     else:
         limited = False
     
+    # start_processing에서 재사용하도록 영상 목록 저장
+    reset_status(session_id, len(video_ids), "처리 준비 중...")
+    with status_lock:
+        processing_status[session_id]['playlist_id'] = playlist_id
+        processing_status[session_id]['video_ids'] = video_ids
+    
     return render_template('processing.html', 
                          session_id=session_id, 
                          total_videos=len(video_ids),
@@ -622,30 +774,66 @@ def process_playlist_manual(playlist_id):
 
 @app.route('/start_processing/<playlist_id>/<session_id>')
 def start_processing(playlist_id, session_id):
-    video_ids = get_playlist_items(playlist_id)
+    with status_lock:
+        cached = processing_status.get(session_id, {})
+        # 새로고침 등으로 다시 호출되면 진행 중인 작업을 그대로 둠
+        # (결과는 작업이 끝날 때 한 번에 저장되므로 중복 실행 시 모든 영상을 다시 분석하게 됨)
+        if is_job_running(cached):
+            return jsonify({"status": "already_started"})
+        video_ids = cached.get('video_ids') if cached.get('playlist_id') == playlist_id else None
+        processing_status[session_id] = {'started': True}
+    
+    if video_ids is None:
+        video_ids = get_playlist_items(playlist_id)
     
     if len(video_ids) > FREE_TIER_LIMIT:
         video_ids = video_ids[:FREE_TIER_LIMIT]
     
-    update_status(session_id, 0, len(video_ids), "처리 준비 중...")
+    update_status(session_id, len(video_ids), "처리 준비 중...")
     
     def process_videos():
-        results = []
-        for idx, video_id in enumerate(video_ids, 1):
-            result = process_single_video(video_id, session_id, idx, len(video_ids))
-            results.append(result)
-            time.sleep(2)
-        
-        success_count = sum(1 for r in results if r.get('status') == 'success')
-        with status_lock:
-            processing_status[session_id]['completed'] = True
-            processing_status[session_id]['success_count'] = success_count
-            processing_status[session_id]['total'] = len(video_ids)
-    
-    import threading
-    thread = threading.Thread(target=process_videos)
-    thread.daemon = True
-    thread.start()
+        success_count = 0
+        try:
+            existing = get_existing_video_ids(video_ids)
+            results = []
+            for video_id in video_ids:
+                if video_id in existing:
+                    logger.info(f"[{video_id}] 이미 처리됨")
+                    results.append({"status": "skipped", "video_id": video_id})
+            if results:
+                update_status(session_id, len(video_ids), "이미 처리된 영상 건너뜀", completed_videos=len(results))
+            
+            pending = [video_id for video_id in video_ids if video_id not in existing]
+            videos_info = get_videos_info_bulk(pending) if pending else {}
+            
+            futures = {
+                EXECUTOR.submit(process_single_video, video_id, session_id, len(video_ids),
+                                videos_info.get(video_id)): video_id
+                for video_id in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"비디오 처리 실패 ({futures[future]}): {e}")
+                    result = {"status": "error", "video_id": futures[future], "message": str(e)}
+                results.append(result)
+                update_status(session_id, len(video_ids), "영상 처리 완료", result.get('title', ''), completed_videos=1)
+            
+            rows = [r['row'] for r in results if r.get('status') == 'success']
+            save_recipes(rows)
+            success_count = len(rows)
+        except Exception:
+            logger.exception(f"플레이리스트 처리 실패 ({session_id})")
+        finally:
+            # 진행 상황 항목이 만료되었을 수 있으므로 인덱싱 대신 setdefault 사용
+            with status_lock:
+                status = processing_status.setdefault(session_id, {})
+                status['completed'] = True
+                status['success_count'] = success_count
+                status['total'] = len(video_ids)
+    
+    JOB_EXECUTOR.submit(process_videos)
     
     return jsonify({"status": "started"})
 
@@ -673,31 +861,58 @@ def recommend_recipe():
     if not user_ingredients_input:
         return render_template('recommend.html', message="재료를 입력해주세요.")
     
-    user_ingredients = set(i.strip() for i in user_ingredients_input.split(',') if i.strip())
+    # 저장된 재료와 같은 형태로 공백 제거 (예: "돼지 고기" → "돼지고기")
+    user_ingredients = frozenset(_WS_RE.sub('', i) for i in user_ingredients_input.split(',') if i.strip())
+    if not user_ingredients:
+        return render_template('recommend.html', message="재료를 입력해주세요.")
     
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    conditions = " OR ".join(["ingredients LIKE ?" for _ in user_ingredients])
-    values = [f"%{ing}%" for ing in user_ingredients]
+    columns = "id, title, url, dish_name, ingredients, data_sources"
+    
+    # 재료별 부분 문자열 검색 (예: 마늘 → 다진마늘)
+    # 쉼표로 구분된 재료와 정확히 일치하는 수를 세어(파이썬 일치율과 같은 기준)
+    # 재료 수 대비 비율이 높은 후보만 가져옴
+    if DATABASE_URL and 'postgres' in DATABASE_URL:
+        contains = "strpos(',' || ingredients || ',', ',' || ? || ',') > 0"
+    else:
+        contains = "instr(',' || ingredients || ',', ',' || ? || ',') > 0"
     
-    query = f"SELECT * FROM recipes WHERE {conditions}"
-    cursor.execute(query, values)
+    terms = list(user_ingredients)
+    conditions = " OR ".join(["ingredients LIKE ?" for _ in terms])
+    where_values = [f"%{ing}%" for ing in terms]
+    score = " + ".join([f"(CASE WHEN {contains} THEN 1 ELSE 0 END)" for _ in terms])
+    ingredient_count = "(length(ingredients) - length(replace(ingredients, ',', '')) + 1)"
+    cursor.execute(f"""
+        SELECT * FROM (
+            SELECT {columns}, ({score}) AS score, {ingredient_count} AS ingredient_count
+            FROM recipes
+            WHERE {conditions}
+        ) AS candidates
+        ORDER BY score * 1.0 / ingredient_count DESC, score DESC
+        LIMIT {RECOMMEND_CANDIDATES}
+    """, [*terms, *where_values])
     results = cursor.fetchall()
-    conn.close()
     
     if not results:
         return render_template('recommend.html', 
                              message="해당 재료로 만들 수 있는 레시피를 찾을 수 없습니다.")
     
-    recipes = []
+    # 일치율 계산 후 상위 RECOMMEND_LIMIT개만 선택 (전체 정렬 생략)
+    scored = []
     for row in results:
-        recipe_ings = set(i.strip() for i in row['ingredients'].split(',') if i.strip())
+        recipe_ings = frozenset(i.strip() for i in row['ingredients'].split(',') if i.strip())
+        match_rate = (len(user_ingredients & recipe_ings) / len(recipe_ings) * 100) if recipe_ings else 0
+        scored.append((match_rate, row, recipe_ings))
+    
+    top = heapq.nlargest(RECOMMEND_LIMIT, scored, key=lambda item: item[0])
+    
+    recipes = []
+    for match_rate, row, recipe_ings in top:
         matched = user_ingredients & recipe_ings
         missing = recipe_ings - user_ingredients
         
-        match_rate = (len(matched) / len(recipe_ings) * 100) if recipe_ings else 0
-        
         recipes.append({
             'title': row['title'],
             'url': row['url'],
@@ -706,11 +921,9 @@ def recommend_recipe():
             'matched': ', '.join(matched),
             'missing': ', '.join(missing),
             'all_ingredients': ', '.join(recipe_ings),
-            'sources': row['data_sources'] if row['data_sources'] is not None else '없음'
+            'sources': format_data_sources(row['data_sources'])
         })
     
-    recipes.sort(key=lambda x: float(x['match_rate']), reverse=True)
-    
     return render_template('recommend.html', 
                          recipes=recipes, 
                          user_ingredients=user_ingredients_input)